@@ -2,21 +2,31 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import Config
+from app.tenants import TenantSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": TenantSession})
 login_manager = LoginManager()
 
 @login_manager.user_loader
 def load_user(user_id):
     """Load user for Flask-Login session management."""
+    from app import tenants
     from app.models import User
+
+    # user ids are only meaningful inside the hospital that issued them
+    if not tenants.session_matches():
+        return None
     return User.query.get(int(user_id))
 
 
-def create_app():
+def create_app(config_class=Config):
     """Application factory for Hospital Management System."""
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
+
+    from app import tenants, snapshot
+    tenants.configure_binds(app)
+    snapshot.configure_binds(app)
 
     db.init_app(app)
     login_manager.init_app(app)
@@ -25,7 +35,26 @@ def create_app():
     from app.routes import main
     app.register_blueprint(main)
 
-    with app.app_context():
-        db.create_all()
+    # every hospital database gets the current tables and indexes
+    for engine in tenants.engines(app).values():
+        tenants.prepare_database(engine)
+
+    app.before_request(tenants.resolve)
+    app.teardown_request(tenants.reset)
+    app.cli.add_command(tenants.tenant_cli)
+
+    snapshot.init_app(app)
+
+    from app import audit
+    audit.init_app(app)
+
+    from app import assets
+    assets.init_app(app)
+
+    from app import live
+    live.init_app(app)
+
+    from app import idempotency
+    idempotency.init_app(app)
 
     return app
@@ -0,0 +1,183 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants are always built
+    brotli = None
+
+# build output lives inside static/ but is never fingerprinted itself
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+
+# only text assets benefit from precompression
+COMPRESSIBLE = {".css", ".js", ".svg", ".map", ".json", ".txt"}
+
+ONE_YEAR = 365 * 24 * 3600
+
+
+def _dist_path(app):
+    return os.path.join(app.static_folder, DIST_DIR)
+
+
+def _compress(data, encoding, level=9):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if level >= 9 else level)
+    # mtime=0 keeps the output identical between builds
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _encodings():
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def build(app):
+    """Copy static files into dist/ under content-hashed names.
+
+    Each text asset also gets .gz (and .br, when brotli is installed)
+    variants next to it. Returns the manifest mapping source names to
+    hashed names. Earlier builds are left in place so pages cached before
+    a deploy can still load the assets they reference.
+    """
+    static = app.static_folder
+    dist = _dist_path(app)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static):
+        if os.path.abspath(root) == os.path.abspath(static):
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+
+        for name in files:
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, static).replace(os.sep, "/")
+
+            with open(src, "rb") as fh:
+                data = fh.read()
+
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem, ext = os.path.splitext(rel)
+            hashed = f"{stem}.{digest}{ext}"
+
+            out = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(out, "wb") as fh:
+                fh.write(data)
+
+            if ext in COMPRESSIBLE:
+                for encoding in _encodings():
+                    suffix = ".br" if encoding == "br" else ".gz"
+                    with open(out + suffix, "wb") as fh:
+                        fh.write(_compress(data, encoding))
+
+            manifest[rel] = hashed
+
+    with open(os.path.join(dist, MANIFEST), "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def load_manifest(app):
+    path = os.path.join(_dist_path(app), MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def asset_url(endpoint, **values):
+    """
+    Drop-in for url_for() in templates.
+
+    url_for('static', filename=...) is rewritten to the fingerprinted copy
+    when the asset has been built; anything else (or an unbuilt asset)
+    goes through url_for unchanged.
+    """
+    if endpoint == "static":
+        hashed = current_app.extensions["assets"].get(values.get("filename"))
+        if hashed:
+            values["filename"] = hashed
+            endpoint = "assets"
+    return url_for(endpoint, **values)
+
+
+def _accepts(encoding):
+    # quality 0 (e.g. "gzip;q=0") means the client refuses the encoding
+    return request.accept_encodings[encoding] > 0
+
+
+def serve_asset(filename):
+    """Serve a fingerprinted asset, preferring a precompressed variant."""
+    dist = _dist_path(current_app)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    for encoding in _encodings():
+        suffix = ".br" if encoding == "br" else ".gz"
+        if _accepts(encoding) and os.path.isfile(os.path.join(dist, filename + suffix)):
+            resp = send_from_directory(
+                dist, filename + suffix, mimetype=mimetype, max_age=ONE_YEAR
+            )
+            resp.headers["Content-Encoding"] = encoding
+            break
+    else:
+        resp = send_from_directory(dist, filename, mimetype=mimetype, max_age=ONE_YEAR)
+
+    if os.path.splitext(filename)[1] in COMPRESSIBLE:
+        resp.vary.add("Accept-Encoding")
+
+    # the name changes whenever the content does
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+def compress_html(response):
+    """Compress HTML pages from the main blueprint (COMPRESS_HTML)."""
+    if (
+        request.blueprint != "main"
+        or response.mimetype != "text/html"
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+    ):
+        return response
+
+    encoding = next((e for e in _encodings() if _accepts(e)), None)
+    response.vary.add("Accept-Encoding")
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+        return response
+
+    response.set_data(_compress(data, encoding, current_app.config["COMPRESS_LEVEL"]))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@click.command("build-assets")
+def build_assets():
+    """Fingerprint and precompress everything under app/static."""
+    manifest = build(current_app)
+    current_app.extensions["assets"] = manifest
+    click.echo(f"Built {len(manifest)} asset(s) into {_dist_path(current_app)}")
+
+
+def init_app(app):
+    app.extensions["assets"] = load_manifest(app)
+    app.add_template_global(asset_url)
+    app.add_url_rule(
+        "/assets/<path:filename>", endpoint="assets", view_func=serve_asset
+    )
+    app.cli.add_command(build_assets)
+
+    if app.config["COMPRESS_HTML"]:
+        app.after_request(compress_html)
@@ -0,0 +1,313 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import date, datetime, time
+
+from flask import has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.orm import Session
+
+from app import tenants
+from app.blocking import offload
+from app.models import User, DoctorProfile, Appointment, Treatment, AuditLog
+from app.tenants import current_tenant
+
+# models whose changes are recorded, keyed by the name stored in audit_log
+AUDITED_MODELS = {
+    User: "user",
+    DoctorProfile: "doctor_profile",
+    Appointment: "appointment",
+    Treatment: "treatment",
+}
+
+# never copy these values into the audit trail
+REDACTED_FIELDS = {"password_hash"}
+
+log = logging.getLogger(__name__)
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def _actor():
+    """Who and which route caused the change, when inside a request."""
+    if not has_request_context():
+        return None, None
+    actor_id = current_user.id if current_user.is_authenticated else None
+    return actor_id, request.endpoint
+
+
+def _diff(obj, action):
+    """Return {field: [before, after]} for the columns touched by this flush."""
+    changes = {}
+    for attr in inspect(obj).mapper.column_attrs:
+        hist = inspect(obj).attrs[attr.key].history
+
+        if action == "update" and not hist.has_changes():
+            continue
+
+        before = hist.deleted[0] if hist.deleted else None
+        if action == "insert":
+            after = getattr(obj, attr.key)
+        elif action == "delete":
+            before, after = getattr(obj, attr.key), None
+        else:
+            after = hist.added[0] if hist.added else None
+
+        if before is None and after is None:
+            continue
+        if attr.key in REDACTED_FIELDS:
+            before = "<redacted>" if before is not None else None
+            after = "<redacted>" if after is not None else None
+
+        changes[attr.key] = [_jsonable(before), _jsonable(after)]
+    return changes
+
+
+class AuditWriter:
+    """
+    Buffers audit entries and writes them to audit_log in batches.
+
+    Each committed entry is appended to a journal segment (and fsynced)
+    before it is buffered, so nothing is lost if the process dies before the
+    background thread gets to it. Every writer owns its own segment, locked
+    with flock for as long as the writer lives; the segment is rotated on
+    every flush and the rotated copy removed once its batch is stored.
+    Segments whose owner is gone are replayed on start.
+    """
+
+    def __init__(self, engines, journal_path, batch_size=200, interval=2.0):
+        # {hospital slug or None: engine}; entries go to their own hospital
+        self.engines = engines
+        self.journal_base = journal_path
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.journal_path = f"{journal_path}.{self.owner}"
+        self.flushing_path = self.journal_path + ".flushing"
+        self.lock_path = self.journal_path + ".lock"
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._buffer = []
+        self._journal = None
+        self._owner_lock = None
+        self._thread = None
+        self._retry_segment = False
+
+    # -------- producer side --------
+
+    def append(self, entries):
+        lines = "".join(json.dumps(e) + "\n" for e in entries)
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            offload(self._write_journal, lines)
+            self._buffer.extend(entries)
+            full = len(self._buffer) >= self.batch_size
+
+        if full:
+            self._wakeup.set()
+
+    def _write_journal(self, lines):
+        self._journal.write(lines)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    # -------- consumer side --------
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        self._owner_lock = open(self.lock_path, "a")
+        fcntl.flock(self._owner_lock, fcntl.LOCK_EX)
+
+        self.recover()
+        self._thread = threading.Thread(
+            target=self._run, name="audit-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 5)
+        self.flush()
+
+        # everything is stored; give up ownership of the (now empty) segment
+        if self._owner_lock is not None and not self._buffer:
+            os.remove(self.lock_path)
+            self._owner_lock.close()
+            self._owner_lock = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # the segment stays on disk; the next flush or restart retries it
+                log.exception("audit flush failed; %d entries still buffered", len(self._buffer))
+
+    def flush(self):
+        """Write everything buffered so far to audit_log."""
+        with self._flush_lock:
+            if self._retry_segment:
+                # a previous flush failed part-way; retry it first
+                offload(self._store, self._read_segment(self.flushing_path))
+                os.remove(self.flushing_path)
+                self._retry_segment = False
+
+            with self._lock:
+                if not self._buffer:
+                    return
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                # if the rename fails the batch stays buffered and journaled
+                os.replace(self.journal_path, self.flushing_path)
+                self._retry_segment = True
+                batch, self._buffer = self._buffer, []
+
+            offload(self._store, batch)
+            os.remove(self.flushing_path)
+            self._retry_segment = False
+
+    def recover(self):
+        """Store journal segments left behind by writers that are gone."""
+        prefix = self.journal_base + "."
+        owners = {
+            path[len(prefix):].split(".")[0]
+            for path in glob.glob(glob.escape(self.journal_base) + ".*")
+        }
+        owners.discard(self.owner)
+
+        with self._flush_lock:
+            for owner in sorted(owners):
+                base = prefix + owner
+                with open(base + ".lock", "a") as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        # a live writer still owns these segments
+                        continue
+
+                    for path in (base + ".flushing", base):
+                        if os.path.exists(path):
+                            self._store(self._read_segment(path))
+                            os.remove(path)
+                    os.remove(base + ".lock")
+
+    @staticmethod
+    def _read_segment(path):
+        entries = []
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # torn final line from a crash mid-write
+                    continue
+        return entries
+
+    def _store(self, entries):
+        by_tenant = {}
+        for e in entries:
+            row = dict(e, created_at=datetime.fromisoformat(e["created_at"]))
+            by_tenant.setdefault(row.pop("tenant", None), []).append(row)
+
+        stmt = insert(AuditLog.__table__).prefix_with("OR IGNORE", dialect="sqlite")
+        for tenant, rows in by_tenant.items():
+            with self.engines[tenant].begin() as conn:
+                for i in range(0, len(rows), self.batch_size):
+                    conn.execute(stmt, rows[i:i + self.batch_size])
+
+
+writer = None
+
+
+# ======================================================
+# SESSION HOOKS
+# ======================================================
+
+def _collect(session, flush_context):
+    actor_id, endpoint = _actor()
+    now = datetime.utcnow().isoformat()
+    pending = session.info.setdefault("audit_pending", [])
+
+    for action, objects in (
+        ("insert", session.new),
+        ("update", session.dirty),
+        ("delete", session.deleted),
+    ):
+        for obj in objects:
+            entity_type = AUDITED_MODELS.get(type(obj))
+            if entity_type is None:
+                continue
+
+            changes = _diff(obj, action)
+            if not changes:
+                continue
+
+            pending.append({
+                "entry_id": uuid.uuid4().hex,
+                "tenant": current_tenant(),
+                "entity_type": entity_type,
+                "entity_id": obj.id,
+                "action": action,
+                "changes": json.dumps(changes),
+                "actor_id": actor_id,
+                "endpoint": endpoint,
+                "created_at": now,
+            })
+
+
+def _publish(session):
+    pending = session.info.pop("audit_pending", None)
+    if pending and writer is not None:
+        writer.append(pending)
+
+
+def _discard(session):
+    session.info.pop("audit_pending", None)
+
+
+def init_app(app):
+    """Hook audit capture into the ORM and start the background writer."""
+    global writer
+
+    journal_path = app.config["AUDIT_JOURNAL_PATH"]
+
+    writer = AuditWriter(
+        tenants.engines(app),
+        journal_path,
+        batch_size=app.config["AUDIT_BATCH_SIZE"],
+        interval=app.config["AUDIT_FLUSH_INTERVAL"],
+    )
+
+    if not event.contains(Session, "after_flush", _collect):
+        event.listen(Session, "after_flush", _collect)
+        event.listen(Session, "after_commit", _publish)
+        event.listen(Session, "after_rollback", _discard)
+
+    writer.start()
+    app.extensions["audit"] = writer
+
+
+def flush():
+    """Force buffered entries out, e.g. before reading the audit trail."""
+    if writer is not None:
+        writer.flush()
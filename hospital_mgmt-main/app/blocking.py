@@ -0,0 +1,23 @@
+def cooperative():
+    """True when threading has been monkey-patched by gevent."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def offload(fn, *args):
+    """
+    Call fn(*args) for blocking work such as fsync, SQLite writes or backups.
+
+    Under gunicorn's gevent worker every background "thread" is a greenlet
+    on the one event loop, so a job stuck in fsync would stall every open
+    stream. There the call runs on gevent's pool of real OS threads and
+    only the calling greenlet waits. Otherwise fn is simply called.
+    """
+    if not cooperative():
+        return fn(*args)
+
+    from gevent import get_hub
+    return get_hub().threadpool.apply(fn, args)
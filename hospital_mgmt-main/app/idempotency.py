@@ -0,0 +1,161 @@
+import functools
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import abort, current_app, flash, make_response, redirect, request, session
+from flask_login import current_user
+from sqlalchemy import delete, insert, select, update
+
+from app import tenants
+from app.blocking import offload
+from app.models import IdempotencyKey
+
+TOKEN = re.compile(r"^[0-9a-f]{32}$")
+
+log = logging.getLogger(__name__)
+
+table = IdempotencyKey.__table__
+
+
+def idempotency_token():
+    """Fresh token for a form; rendered into a hidden input."""
+    return uuid.uuid4().hex
+
+
+def _engine():
+    from app import db
+    return db.session.get_bind()
+
+
+def _claim(engine, token):
+    """Insert a pending row; True if this request now owns the token."""
+    with engine.begin() as conn:
+        result = conn.execute(
+            insert(table).prefix_with("OR IGNORE", dialect="sqlite").values(
+                token=token,
+                user_id=current_user.id,
+                endpoint=request.endpoint,
+                state="pending",
+                created_at=datetime.utcnow(),
+            )
+        )
+        return result.rowcount == 1
+
+
+def _wait_for_result(engine, token):
+    """Row for a token owned by another request, once it has finished."""
+    deadline = time.monotonic() + current_app.config["IDEMPOTENCY_WAIT"]
+    while True:
+        with engine.connect() as conn:
+            row = conn.execute(select(table).where(table.c.token == token)).first()
+
+        if row is None or row.state == "done" or time.monotonic() >= deadline:
+            return row
+        time.sleep(0.05)
+
+
+def _replay(row):
+    for category, message in json.loads(row.flashes or "[]"):
+        flash(message, category)
+    return redirect(row.location)
+
+
+def idempotent(view):
+    """
+    Run a POST at most once per form token.
+
+    The first request claims the token, runs the view and stores its
+    redirect and flash messages. Duplicates (double submits, proxy
+    retries) replay that outcome without running the view again.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.form.get("idempotency_key")
+        if request.method != "POST" or not token:
+            return view(*args, **kwargs)
+        if not TOKEN.match(token):
+            abort(400)
+
+        engine = _engine()
+
+        # a token released by a failed attempt is claimed again, but only once
+        for _ in range(2):
+            if _claim(engine, token):
+                break
+            row = _wait_for_result(engine, token)
+            if row is None:
+                continue
+            if row.user_id != current_user.id or row.endpoint != request.endpoint:
+                abort(422)
+            if row.state != "done":
+                abort(409)
+            return _replay(row)
+        else:
+            abort(409)
+
+        flashed_before = len(session.get("_flashes", []))
+        try:
+            # views may return a rendered template rather than a Response
+            response = make_response(view(*args, **kwargs))
+
+            with engine.begin() as conn:
+                if response.status_code in (301, 302, 303, 307, 308):
+                    flashes = session.get("_flashes", [])[flashed_before:]
+                    conn.execute(
+                        update(table)
+                        .where(table.c.token == token)
+                        .values(
+                            state="done",
+                            location=response.location,
+                            flashes=json.dumps(flashes),
+                        )
+                    )
+                else:
+                    # nothing worth replaying (e.g. a re-rendered form)
+                    conn.execute(delete(table).where(table.c.token == token))
+        except Exception:
+            # never leave the token pending, or every retry gets a 409
+            with engine.begin() as conn:
+                conn.execute(delete(table).where(table.c.token == token))
+            raise
+
+        return response
+    return wrapper
+
+
+def purge(engines, ttl):
+    """Drop tokens older than the TTL from every hospital database."""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    for engine in engines.values():
+        with engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.created_at < cutoff))
+
+
+def _purger(engines, ttl, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            offload(purge, engines, ttl)
+        except Exception:
+            # a busy database just delays the purge to the next round
+            log.exception("idempotency key purge failed")
+
+
+def init_app(app):
+    app.add_template_global(idempotency_token)
+
+    threading.Thread(
+        target=_purger,
+        args=(
+            tenants.engines(app),
+            app.config["IDEMPOTENCY_TTL"],
+            app.config["IDEMPOTENCY_PURGE_INTERVAL"],
+        ),
+        name="idempotency-purge",
+        daemon=True,
+    ).start()
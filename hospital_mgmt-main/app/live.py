@@ -0,0 +1,177 @@
+import json
+import queue
+import threading
+import uuid
+from datetime import date, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import User, Appointment
+from app.tenants import current_tenant
+
+
+class Hub:
+    """
+    In-process pub/sub: one bounded queue per open stream, keyed by
+    (hospital, doctor) since doctor ids repeat across hospitals.
+
+    Publishing never blocks a request; a subscriber that falls too far
+    behind is sent a "resync" event and dropped, and its page reloads.
+
+    Every event gets an id, and the latest id per key is kept so a stream
+    can tell whether its client missed anything while it was not
+    subscribed. Ids start with a per-process epoch, so ids from before a
+    restart never match.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._seq = 0
+        self._latest = {}
+
+    def subscribe(self, key):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(q)
+        return q
+
+    def unsubscribe(self, key, q):
+        with self._lock:
+            subs = self._subscribers.get(key)
+            if subs is not None:
+                subs.discard(q)
+                if not subs:
+                    del self._subscribers[key]
+
+    def last_event_id(self, key):
+        with self._lock:
+            return self._latest.get(key, f"{self.epoch}-0")
+
+    def publish(self, key, name, data):
+        with self._lock:
+            self._seq += 1
+            event_id = self._latest[key] = f"{self.epoch}-{self._seq}"
+            subs = list(self._subscribers.get(key, ()))
+
+        for q in subs:
+            try:
+                q.put_nowait((name, data, event_id))
+            except queue.Full:
+                self.unsubscribe(key, q)
+                _drain(q)
+                q.put_nowait(("resync", {}, None))
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+def _drain(q):
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
+
+
+hub = None
+
+
+def format_event(name, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def last_event_id(tenant, doctor_id):
+    """Id of the newest event for one doctor; pages render it as `since`."""
+    return hub.last_event_id((tenant, doctor_id))
+
+
+def stream(tenant, doctor_id, keepalive, since=None):
+    """
+    Yield server-sent events for one doctor until the client goes away.
+
+    `since` is the last event id the client has seen: the Last-Event-ID of
+    a reconnect, or the id rendered into the page. If anything was
+    published after it, the client missed it and is told to resync.
+    """
+    key = (tenant, doctor_id)
+    # subscribe before comparing ids so nothing slips in between
+    q = hub.subscribe(key)
+    try:
+        latest = hub.last_event_id(key)
+        if since is not None and since != latest:
+            yield format_event("resync", {})
+            return
+
+        # the id gives the browser a Last-Event-ID to send on reconnect
+        yield f"retry: {keepalive * 1000}\nid: {latest}\n\n"
+        while True:
+            try:
+                name, data, event_id = q.get(timeout=keepalive)
+            except queue.Empty:
+                # comment line keeps proxies from timing the stream out
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(name, data, event_id)
+            if name == "resync":
+                return
+    finally:
+        hub.unsubscribe(key, q)
+
+
+# ======================================================
+# SESSION HOOKS
+# ======================================================
+
+def _appointment_payload(session, appt):
+    patient = session.get(User, appt.patient_id)
+    today = date.today()
+    return {
+        "id": appt.id,
+        "patient_id": appt.patient_id,
+        "patient_name": patient.name if patient else "",
+        "patient_email": patient.email if patient else "",
+        "date": appt.date.isoformat(),
+        "time": appt.time.strftime("%H:%M:%S"),
+        "status": appt.status or "Booked",
+        "upcoming": (
+            (appt.status or "Booked") == "Booked"
+            and today <= appt.date <= today + timedelta(days=7)
+        ),
+    }
+
+
+def _collect(session, flush_context):
+    pending = session.info.setdefault("live_pending", {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Appointment) and (obj in session.new or session.is_modified(obj)):
+            # last write per appointment wins within one transaction
+            key = (current_tenant(), obj.doctor_id)
+            pending[obj.id] = (key, _appointment_payload(session, obj))
+
+
+def _publish(session):
+    pending = session.info.pop("live_pending", None)
+    if pending and hub is not None:
+        for key, payload in pending.values():
+            hub.publish(key, "appointment", payload)
+
+
+def _discard(session):
+    session.info.pop("live_pending", None)
+
+
+def init_app(app):
+    global hub
+    hub = Hub(queue_size=app.config["LIVE_QUEUE_SIZE"])
+    app.extensions["live"] = hub
+
+    if not event.contains(Session, "after_flush", _collect):
+        event.listen(Session, "after_flush", _collect)
+        event.listen(Session, "after_commit", _publish)
+        event.listen(Session, "after_rollback", _discard)
@@ -16,6 +16,10 @@ class User(UserMixin, db.Model):
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_user_role_active", "role", "active"),
+    )
+
     def __repr__(self):
         return f"<User {self.id} | {self.role} | {self.email}>"
 
@@ -41,8 +45,8 @@ class DoctorProfile(db.Model):
     __tablename__ = "doctor_profile"
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    department_id = db.Column(db.Integer, db.ForeignKey("department.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    department_id = db.Column(db.Integer, db.ForeignKey("department.id"), nullable=False, index=True)
 
     availability = db.Column(db.Text)
 
@@ -69,6 +73,15 @@ class Appointment(db.Model):
     status = db.Column(db.String(20), default="Booked") 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # doctor's schedule and slot-conflict checks
+        db.Index("ix_appointment_doctor_slot", "doctor_id", "date", "time"),
+        # patient's appointment history
+        db.Index("ix_appointment_patient_date", "patient_id", "date"),
+        # admin overview, newest first
+        db.Index("ix_appointment_date", "date"),
+    )
+
     patient = db.relationship(
         "User",
         foreign_keys=[patient_id],
@@ -94,7 +107,8 @@ class Treatment(db.Model):
     appointment_id = db.Column(
         db.Integer,
         db.ForeignKey("appointment.id"),
-        nullable=False
+        nullable=False,
+        index=True
     )
     diagnosis = db.Column(db.Text)
     prescription = db.Column(db.Text)
@@ -107,3 +121,72 @@ class Treatment(db.Model):
 
     def __repr__(self):
         return f"<Treatment appointment_id={self.appointment_id}>"
+
+
+# --------------------
+# AUDIT LOG (append-only)
+# --------------------
+class AuditLog(db.Model):
+    __tablename__ = "audit_log"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # unique per change so replaying the journal after a crash is idempotent
+    entry_id = db.Column(db.String(32), unique=True, nullable=False)
+
+    entity_type = db.Column(db.String(40), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # insert / update / delete
+    changes = db.Column(db.Text, nullable=False)       # JSON {field: [before, after]}
+
+    actor_id = db.Column(db.Integer)
+    endpoint = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_audit_log_entity", "entity_type", "entity_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<AuditLog {self.entity_type}:{self.entity_id} {self.action}>"
+
+
+# audit rows are never rewritten once stored
+db.event.listen(
+    AuditLog.__table__,
+    "after_create",
+    db.DDL(
+        "CREATE TRIGGER IF NOT EXISTS audit_log_no_update "
+        "BEFORE UPDATE ON audit_log "
+        "BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END"
+    ).execute_if(dialect="sqlite"),
+)
+db.event.listen(
+    AuditLog.__table__,
+    "after_create",
+    db.DDL(
+        "CREATE TRIGGER IF NOT EXISTS audit_log_no_delete "
+        "BEFORE DELETE ON audit_log "
+        "BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END"
+    ).execute_if(dialect="sqlite"),
+)
+
+
+# --------------------
+# IDEMPOTENCY KEY (form resubmission guard)
+# --------------------
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_key"
+
+    token = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    endpoint = db.Column(db.String(80), nullable=False)
+    state = db.Column(db.String(10), nullable=False, default="pending")  # pending / done
+
+    # the original outcome, replayed for duplicates
+    location = db.Column(db.Text)
+    flashes = db.Column(db.Text)  # JSON [[category, message], ...]
+
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.token} {self.endpoint} ({self.state})>"
@@ -0,0 +1,313 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import date, time, timedelta
+
+import click
+from flask import has_request_context, request, url_for
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.security import generate_password_hash
+
+from config import Config
+
+# lookup tables that stay small enough for a scan to be harmless; every
+# other table (appointment, user, doctor_profile, treatment, ...) is checked
+SMALL_TABLES = {"department"}
+
+# (endpoint, statement, plan line) triples where a scan or sort is inherent
+# to that one query; both patterns must match the whole whitespace-collapsed
+# statement / plan line, so a new query on the same route is still checked
+ALLOWED_PLANS = [
+    # counts every appointment; walks the narrow ix_appointment_date
+    ("main.admin_dashboard",
+     r"SELECT count\(\*\) AS count_1 FROM \(SELECT [\w., ]+ FROM appointment\) AS anon_1",
+     r"SCAN appointment USING COVERING INDEX ix_appointment_date"),
+    # lists every appointment, newest first, in index order
+    ("main.admin_appointments",
+     r"SELECT [\w., ]+ FROM appointment ORDER BY appointment\.date DESC",
+     r"SCAN appointment USING INDEX ix_appointment_date"),
+    # per-hospital totals by status aggregate every appointment
+    ("main.admin_hospitals",
+     r"SELECT appointment\.status AS appointment_status, count\(\*\) AS count_1 "
+     r"FROM appointment GROUP BY appointment\.status",
+     r"SCAN appointment|USE TEMP B-TREE FOR GROUP BY"),
+    # substring search on name/email/specialization cannot use a b-tree
+    # index, so every user / doctor profile is checked against the pattern
+    ("main.admin_search",
+     r"SELECT [\w., ]+ FROM user WHERE lower\(user\.name\) LIKE lower\(\?\) "
+     r"OR lower\(user\.email\) LIKE lower\(\?\)",
+     r"SCAN user"),
+    ("main.admin_search",
+     r"SELECT [\w., ]+ FROM doctor_profile JOIN user ON [\w.= ]+ JOIN department ON [\w.= ]+ "
+     r"WHERE lower\(department\.name\) LIKE lower\(\?\)",
+     r"SCAN doctor_profile"),
+]
+
+PASSWORD = "plan-check"
+
+# every route in the main blueprint, with the requests that exercise it;
+# order matters because later requests see the writes of earlier ones
+ROUTE_REQUESTS = [
+    ("main.index", None, "GET", {}, None),
+    ("main.login", None, "GET", {}, None),
+    ("main.login", None, "POST", {}, {"email": "patient@plan.test", "password": PASSWORD}),
+    ("main.register", None, "GET", {}, None),
+    ("main.register", None, "POST", {}, {"name": "New", "email": "new@plan.test", "password": PASSWORD}),
+
+    ("main.admin_dashboard", "admin", "GET", {}, None),
+    ("main.add_doctor", "admin", "GET", {}, None),
+    ("main.add_doctor", "admin", "POST", {}, {
+        "name": "Added", "email": "added@plan.test", "password": PASSWORD, "department_id": "1",
+    }),
+    ("main.view_doctors", "admin", "GET", {}, None),
+    ("main.edit_doctor", "admin", "GET", {"doctor_id": 2}, None),
+    ("main.edit_doctor", "admin", "POST", {"doctor_id": 2}, {
+        "name": "Doctor", "department_id": "1", "availability": "Mon-Fri",
+    }),
+    ("main.add_department", "admin", "GET", {}, None),
+    ("main.add_department", "admin", "POST", {}, {"name": "Neurology", "description": ""}),
+    ("main.admin_search", "admin", "GET", {}, None),
+    ("main.admin_search", "admin", "POST", {}, {"query": "doc"}),
+    ("main.edit_patient", "admin", "GET", {"patient_id": 4}, None),
+    ("main.edit_patient", "admin", "POST", {"patient_id": 4}, {
+        "name": "Other", "email": "other@plan.test", "active": "on",
+    }),
+    ("main.admin_appointments", "admin", "GET", {}, None),
+    ("main.admin_audit", "admin", "GET", {"entity_type": "appointment", "entity_id": 1}, None),
+    ("main.admin_hospitals", "admin", "GET", {}, None),
+
+    ("main.doctor_dashboard", "doctor", "GET", {}, None),
+    ("main.doctor_stream", "doctor", "GET", {}, None),
+    ("main.doctor_appointments", "doctor", "GET", {}, None),
+    ("main.doctor_availability", "doctor", "GET", {}, None),
+    ("main.doctor_availability", "doctor", "POST", {}, {"availability": "Mon-Sat"}),
+    ("main.complete_appointment", "doctor", "GET", {"appt_id": 1}, None),
+    ("main.complete_appointment", "doctor", "POST", {"appt_id": 1}, {
+        "diagnosis": "Flu", "prescription": "Rest", "notes": "",
+        "idempotency_key": "c0" * 16,
+    }),
+    # a resubmit of the same form is replayed from idempotency_key
+    ("main.complete_appointment", "doctor", "POST", {"appt_id": 1}, {
+        "diagnosis": "Flu", "prescription": "Rest", "notes": "",
+        "idempotency_key": "c0" * 16,
+    }),
+    ("main.doctor_cancel_appointment", "doctor", "GET", {"appt_id": 2}, None),
+
+    ("main.patient_dashboard", "patient", "GET", {}, None),
+    ("main.patient_appointments", "patient", "GET", {}, None),
+    ("main.patient_profile", "patient", "GET", {}, None),
+    ("main.patient_profile", "patient", "POST", {}, {"name": "Patient", "email": "patient@plan.test"}),
+    ("main.view_departments", "patient", "GET", {}, None),
+    ("main.view_doctors_by_department", "patient", "GET", {"dept_id": 1}, None),
+    ("main.view_doctors_by_department", "patient", "POST", {"dept_id": 1}, {"availability": "Mon"}),
+    ("main.book_appointment", "patient", "GET", {"doctor_id": 2}, None),
+    ("main.book_appointment", "patient", "POST", {"doctor_id": 2}, {
+        "date": "2031-01-06", "time": "09:00", "idempotency_key": "b0" * 16,
+    }),
+    ("main.reschedule_appointment", "patient", "GET", {"appt_id": 3}, None),
+    ("main.reschedule_appointment", "patient", "POST", {"appt_id": 3}, {
+        "date": "2031-01-07", "time": "10:00", "idempotency_key": "a0" * 16,
+    }),
+    ("main.cancel_appointment", "patient", "GET", {"appt_id": 3}, None),
+
+    ("main.deactivate_patient", "admin", "GET", {"patient_id": 4}, None),
+    ("main.deactivate_doctor", "admin", "GET", {"doctor_id": 3}, None),
+    ("main.logout", "admin", "GET", {}, None),
+]
+
+ROLE_EMAILS = {
+    "admin": "admin@plan.test",
+    "doctor": "doctor@plan.test",
+    "patient": "patient@plan.test",
+}
+
+# SQLite before 3.36 says "SCAN TABLE x" / "SEARCH TABLE x"
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+_OLD_WORDING = re.compile(r"^(SCAN|SEARCH) TABLE ")
+_TABLES = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+"?(\w+)"?', re.IGNORECASE)
+_ALLOWED = [
+    (endpoint, re.compile(statement), re.compile(line))
+    for endpoint, statement, line in ALLOWED_PLANS
+]
+
+
+def _allowed(endpoint, statement, detail):
+    statement = " ".join(statement.split())
+    detail = _OLD_WORDING.sub(r"\1 ", detail)
+    return any(
+        endpoint == ep and sql.fullmatch(statement) and line.fullmatch(detail)
+        for ep, sql, line in _ALLOWED
+    )
+
+
+def seed(db):
+    """Populate a scratch database with a little of everything."""
+    from app.models import User, Department, DoctorProfile, Appointment
+
+    def user(name, role):
+        return User(
+            name=name,
+            email=f"{name.lower()}@plan.test",
+            role=role,
+            password_hash=generate_password_hash(PASSWORD),
+        )
+
+    admin = user("Admin", "admin")
+    doctor = user("Doctor", "doctor")
+    other_doctor = user("Colleague", "doctor")
+    other_patient = user("Other", "patient")
+    patient = user("Patient", "patient")
+    db.session.add_all([admin, doctor, other_doctor, other_patient, patient])
+    db.session.add(Department(name="Cardiology", description="Heart"))
+    db.session.commit()
+
+    db.session.add_all([
+        DoctorProfile(user_id=doctor.id, department_id=1, availability="Mon-Fri"),
+        DoctorProfile(user_id=other_doctor.id, department_id=1, availability="Tue"),
+    ])
+    soon = date.today() + timedelta(days=2)
+    db.session.add_all([
+        Appointment(patient_id=patient.id, doctor_id=doctor.id, date=soon, time=time(9)),
+        Appointment(patient_id=other_patient.id, doctor_id=doctor.id, date=soon, time=time(10)),
+        Appointment(patient_id=patient.id, doctor_id=other_doctor.id, date=soon, time=time(11)),
+    ])
+    db.session.commit()
+
+
+def capture_route_queries(app):
+    """Issue every request in ROUTE_REQUESTS; return [(endpoint, sql, params)]."""
+    from app import db
+
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and statement.lstrip().upper().startswith(
+            ("SELECT", "INSERT", "UPDATE", "DELETE")
+        ):
+            if executemany:
+                parameters = parameters[0]
+            captured.append((request.endpoint, statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+        seed(db)
+
+    # every engine, so snapshot-routed reads are captured too
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        client = app.test_client()
+        logged_in = None
+        for endpoint, role, method, view_args, form in ROUTE_REQUESTS:
+            if role != logged_in:
+                client.get("/logout")
+                if role:
+                    client.post("/login", data={"email": ROLE_EMAILS[role], "password": PASSWORD})
+                logged_in = role
+
+            with app.test_request_context():
+                url = url_for(endpoint, **view_args)
+
+            resp = client.open(url, method=method, data=form)
+            # streaming responses are never read, only opened
+            resp.close()
+            if resp.status_code >= 500:
+                raise click.ClickException(f"{method} {url} failed with {resp.status_code}")
+            if endpoint == "main.logout":
+                logged_in = None
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+    return captured, engine
+
+
+def plan_problems(endpoint, statement, plan):
+    """Return a list of human readable problems found in one query plan."""
+    problems = []
+    tables = {t.lower() for t in _TABLES.findall(statement)}
+
+    for detail in plan:
+        m = _SCAN.match(detail)
+        if m:
+            table = m.group(1)
+            # walking a whole index is still a full scan
+            if table in SMALL_TABLES or _allowed(endpoint, statement, detail):
+                continue
+            problems.append(f"full scan of {table}: {detail}")
+
+        elif detail.startswith("USE TEMP B-TREE"):
+            if tables - SMALL_TABLES and not _allowed(endpoint, statement, detail):
+                problems.append(f"temp b-tree sort: {detail}")
+
+    return problems
+
+
+def check_app_plans(app):
+    """Run EXPLAIN QUERY PLAN over every route query; return the failures."""
+    covered = {r[0] for r in ROUTE_REQUESTS}
+    missing = sorted(
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if rule.endpoint.startswith("main.") and rule.endpoint not in covered
+    )
+    failures = [(ep, "route has no entry in ROUTE_REQUESTS", None) for ep in missing]
+
+    captured, engine = capture_route_queries(app)
+
+    seen = set()
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for endpoint, statement, params in captured:
+            if (endpoint, statement) in seen:
+                continue
+            seen.add((endpoint, statement))
+
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, params)
+            plan = [row[3] for row in cursor.fetchall()]
+            for problem in plan_problems(endpoint, statement, plan):
+                failures.append((endpoint, problem, statement))
+    finally:
+        raw.close()
+
+    return failures
+
+
+# run as `python -m app.query_plans`, not through `flask --app run`: that
+# would boot the app against the real hospital.db just to host the command
+@click.command("check-query-plans")
+def check_query_plans():
+    """Fail if any route query scans a large table or sorts in a temp b-tree."""
+    from app import create_app
+
+    scratch = tempfile.mkdtemp(prefix="hms-plans-")
+
+    class PlanConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(scratch, "plans.db")
+        AUDIT_JOURNAL_PATH = os.path.join(scratch, "audit.journal")
+        TENANTS_FILE = os.path.join(scratch, "tenants.json")
+        SNAPSHOT_DIR = os.path.join(scratch, "snapshots")
+
+    app = create_app(PlanConfig)
+    try:
+        failures = check_app_plans(app)
+    finally:
+        app.extensions["audit"].stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    for endpoint, problem, statement in failures:
+        click.echo(f"{endpoint}: {problem}")
+        if statement:
+            click.echo("    " + " ".join(statement.split()))
+
+    if failures:
+        click.echo(f"{len(failures)} query plan problem(s)")
+        sys.exit(1)
+
+    click.echo("All route query plans OK")
+
+
+if __name__ == "__main__":
+    check_query_plans()
@@ -1,10 +1,13 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, Response, current_app, render_template, redirect, url_for, request, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import date, timedelta, datetime
+import json
 
-from app import db
-from app.models import User, Department, DoctorProfile, Appointment, Treatment
+from app import db, audit, live, tenants
+from app.snapshot import reads_from_snapshot
+from app.idempotency import idempotent
+from app.models import User, Department, DoctorProfile, Appointment, Treatment, AuditLog
 
 main = Blueprint("main", __name__)
 
@@ -31,6 +34,7 @@ def login():
 
         if user and check_password_hash(user.password_hash, password):
             login_user(user)
+            tenants.remember_login()
             return redirect(url_for(f"main.{user.role}_dashboard"))
 
         flash("Invalid email or password", "danger")
@@ -87,7 +91,8 @@ def admin_dashboard():
         "admin_dashboard.html",
         doctor_count=doctor_count,
         patient_count=patient_count,
-        appointment_count=appointment_count
+        appointment_count=appointment_count,
+        head_office=tenants.current_tenant() is None
     )
 
 
@@ -213,6 +218,7 @@ def add_department():
 
 @main.route("/admin/search", methods=["GET", "POST"])
 @login_required
+@reads_from_snapshot
 def admin_search():
     if current_user.role != "admin":
         return redirect(url_for("main.index"))
@@ -291,6 +297,7 @@ def deactivate_patient(patient_id):
 
 @main.route("/admin/appointments")
 @login_required
+@reads_from_snapshot
 def admin_appointments():
     if current_user.role != "admin":
         return redirect(url_for("main.index"))
@@ -301,6 +308,60 @@ def admin_appointments():
 
     return render_template("admin_appointments.html", appointments=appointments)
 
+
+def _hospital_summary():
+    """Headline counts for the hospital the current context is routed to."""
+    by_status = dict(
+        db.session.query(Appointment.status, db.func.count())
+        .group_by(Appointment.status)
+        .all()
+    )
+    return {
+        "doctors": User.query.filter_by(role="doctor").count(),
+        "patients": User.query.filter_by(role="patient").count(),
+        "booked": by_status.get("Booked", 0),
+        "completed": by_status.get("Completed", 0),
+        "cancelled": by_status.get("Cancelled", 0),
+    }
+
+
+@main.route("/admin/hospitals")
+@login_required
+@reads_from_snapshot
+def admin_hospitals():
+    # cross-hospital reporting is for head-office (default hospital) admins
+    if current_user.role != "admin" or tenants.current_tenant() is not None:
+        return redirect(url_for("main.index"))
+
+    summaries = tenants.fan_out(_hospital_summary)
+
+    return render_template("admin_hospitals.html", summaries=summaries)
+
+
+@main.route("/admin/audit/<entity_type>/<int:entity_id>")
+@login_required
+def admin_audit(entity_type, entity_id):
+    if current_user.role != "admin":
+        return redirect(url_for("main.index"))
+
+    # make sure recently committed changes are visible
+    audit.flush()
+
+    entries = AuditLog.query.filter_by(
+        entity_type=entity_type,
+        entity_id=entity_id
+    ).order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).all()
+
+    for e in entries:
+        e.diff = json.loads(e.changes)
+
+    return render_template(
+        "admin_audit.html",
+        entity_type=entity_type,
+        entity_id=entity_id,
+        entries=entries
+    )
+
 # ======================================================
 # DOCTOR
 # ======================================================
@@ -311,6 +372,10 @@ def doctor_dashboard():
     if current_user.role != "doctor":
         return redirect(url_for("main.index"))
 
+    # taken before the queries: anything published later reaches the
+    # page over the stream, or makes it resync
+    live_since = live.last_event_id(tenants.current_tenant(), current_user.id)
+
     today = date.today()
     week_later = today + timedelta(days=7)
 
@@ -320,18 +385,39 @@ def doctor_dashboard():
         Appointment.status == "Booked"
     ).all()
 
-    patients = (
-        db.session.query(User)
-        .join(Appointment, Appointment.patient_id == User.id)
-        .filter(Appointment.doctor_id == current_user.id)
-        .distinct()
-        .all()
-    )
+    # IN-subquery rather than JOIN + DISTINCT, so no temp b-tree is needed
+    patients = User.query.filter(
+        User.id.in_(
+            db.session.query(Appointment.patient_id)
+            .filter(Appointment.doctor_id == current_user.id)
+        )
+    ).all()
 
     return render_template(
         "doctor_dashboard.html",
         upcoming_appointments=upcoming,
-        patients=patients
+        patients=patients,
+        live_since=live_since
+    )
+
+
+@main.route("/doctor/stream")
+@login_required
+def doctor_stream():
+    if current_user.role != "doctor":
+        return redirect(url_for("main.index"))
+
+    doctor_id = current_user.id
+    tenant = tenants.current_tenant()
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+
+    # an idle stream must not keep a pooled connection checked out
+    db.session.close()
+
+    return Response(
+        live.stream(tenant, doctor_id, current_app.config["LIVE_KEEPALIVE"], since),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
@@ -350,6 +436,7 @@ def doctor_appointments():
 
 @main.route("/doctor/complete-appointment/<int:appt_id>", methods=["GET", "POST"])
 @login_required
+@idempotent
 def complete_appointment(appt_id):
     if current_user.role != "doctor":
         return redirect(url_for("main.index"))
@@ -361,6 +448,10 @@ def complete_appointment(appt_id):
         return redirect(url_for("main.doctor_appointments"))
 
     if request.method == "POST":
+        if appt.status == "Completed":
+            flash("Appointment is already completed", "info")
+            return redirect(url_for("main.doctor_appointments"))
+
         treatment = Treatment(
             appointment_id=appt.id,
             diagnosis=request.form.get("diagnosis"),
@@ -497,6 +588,7 @@ def cancel_appointment(appt_id):
 
 @main.route("/patient/reschedule-appointment/<int:appt_id>", methods=["GET", "POST"])
 @login_required
+@idempotent
 def reschedule_appointment(appt_id):
     if current_user.role != "patient":
         return redirect(url_for("main.index"))
@@ -582,6 +674,7 @@ def view_doctors_by_department(dept_id):
 
 @main.route("/book-appointment/<int:doctor_id>", methods=["GET", "POST"])
 @login_required
+@idempotent
 def book_appointment(doctor_id):
     if current_user.role != "patient":
         return redirect(url_for("main.index"))
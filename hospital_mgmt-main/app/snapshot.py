@@ -0,0 +1,169 @@
+import contextvars
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.pool import NullPool
+
+from app.blocking import offload
+from app.tenants import load_registry
+
+log = logging.getLogger(__name__)
+
+# set of hospitals whose snapshot this request has read from; None when
+# the request is not snapshot-routed
+_reads = contextvars.ContextVar("snapshot_reads", default=None)
+
+
+def bind_key(slug):
+    return "snapshot" if slug is None else f"snapshot:{slug}"
+
+
+def read_bind(slug):
+    """Bind key to use for this query, or None to use the live database."""
+    reads = _reads.get()
+    if reads is None:
+        return None
+    reads.add(slug)
+    return bind_key(slug)
+
+
+def reads_from_snapshot(view):
+    """Serve a read-only view from the snapshot database when enabled."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config["SNAPSHOT_ENABLED"]:
+            return view(*args, **kwargs)
+        token = _reads.set(set())
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _reads.reset(token)
+    return wrapper
+
+
+class Snapshot:
+    """A periodically refreshed, read-only copy of one SQLite database."""
+
+    def __init__(self, source_path, snapshot_path):
+        self.source_path = source_path
+        self.snapshot_path = snapshot_path
+        self.taken_at = None
+        self._lock = threading.Lock()
+        self._source = None
+        self._data_version = None
+
+    def changed(self):
+        """True if anything committed to the source since the last refresh."""
+        with self._lock:
+            if self._source is None:
+                return True
+            version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            return version != self._data_version
+
+    def refresh(self):
+        with self._lock:
+            if self._source is None:
+                self._source = sqlite3.connect(self.source_path, check_same_thread=False)
+
+            # read before copying: a commit that lands during the copy then
+            # shows up as a change and is picked up by the next refresh
+            version = self._source.execute("PRAGMA data_version").fetchone()[0]
+
+            tmp = self.snapshot_path + ".tmp"
+            dst = sqlite3.connect(tmp)
+            try:
+                # the live databases run in WAL mode (see
+                # tenants.prepare_database), so the copy's read transaction
+                # does not block writers
+                self._source.backup(dst)
+                # read-only connections cannot open a WAL file without its
+                # -shm, so store the copy in rollback-journal mode
+                dst.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                dst.close()
+
+            # open readers keep the old file; new connections see this one
+            os.replace(tmp, self.snapshot_path)
+            self._data_version = version
+            self.taken_at = datetime.utcnow()
+
+    def close(self):
+        """Drop the connection to the source; the next refresh reopens it."""
+        with self._lock:
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+
+    def age(self):
+        return (datetime.utcnow() - self.taken_at).total_seconds()
+
+
+def configure_binds(app):
+    """Add a read-only, unpooled bind per database for its snapshot file."""
+    if not app.config["SNAPSHOT_ENABLED"]:
+        return
+
+    os.makedirs(app.config["SNAPSHOT_DIR"], exist_ok=True)
+    sources = {None: app.config["SQLALCHEMY_DATABASE_URI"].replace("sqlite:///", "", 1)}
+    for slug, entry in load_registry(app.config["TENANTS_FILE"]).items():
+        sources[slug] = entry["db"]
+
+    snapshots = {}
+    binds = app.config["SQLALCHEMY_BINDS"]
+    for slug, source in sources.items():
+        name = f"{slug or app.config['TENANT_DEFAULT_NAME']}.db"
+        snap = Snapshot(source, os.path.join(app.config["SNAPSHOT_DIR"], name))
+        snapshots[slug] = snap
+        binds[bind_key(slug)] = {
+            "url": f"sqlite:///file:{snap.snapshot_path}?mode=ro&uri=true",
+            # a fresh connection per checkout always opens the newest file
+            "poolclass": NullPool,
+        }
+    app.extensions["snapshots"] = snapshots
+
+
+def _refresher(snapshots, interval, max_lag):
+    while True:
+        time.sleep(interval)
+        for snap in snapshots.values():
+            try:
+                if snap.age() >= max_lag and offload(snap.changed):
+                    offload(snap.refresh)
+            except sqlite3.Error:
+                # keep serving the previous snapshot; retry next round
+                log.exception("snapshot refresh of %s failed", snap.source_path)
+
+
+def staleness():
+    """Age of the oldest snapshot this request read from, or None."""
+    reads = _reads.get()
+    if not reads:
+        return None
+    snapshots = current_app.extensions["snapshots"]
+    oldest = min((snapshots[slug] for slug in reads), key=lambda s: s.taken_at)
+    return {"taken_at": oldest.taken_at, "age": int(oldest.age())}
+
+
+def init_app(app):
+    """Take the first snapshots and start refreshing them in the background."""
+    app.context_processor(lambda: {"snapshot": staleness()})
+
+    if not app.config["SNAPSHOT_ENABLED"]:
+        return
+
+    snapshots = app.extensions["snapshots"]
+    for snap in snapshots.values():
+        snap.refresh()
+
+    threading.Thread(
+        target=_refresher,
+        args=(snapshots, app.config["SNAPSHOT_CHECK_INTERVAL"], app.config["SNAPSHOT_MAX_LAG"]),
+        name="snapshot-refresher",
+        daemon=True,
+    ).start()
@@ -0,0 +1,311 @@
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+import click
+from flask import abort, current_app, request, session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from werkzeug.security import generate_password_hash
+
+# None means the default hospital, i.e. SQLALCHEMY_DATABASE_URI
+_current = ContextVar("tenant", default=None)
+
+SLUG = re.compile(r"^[a-z0-9][a-z0-9-]{0,39}$")
+
+
+def bind_key(slug):
+    return f"tenant:{slug}"
+
+
+def current_tenant():
+    return _current.get()
+
+
+@contextmanager
+def use(slug):
+    """Route database work in this block to one hospital's database."""
+    token = _current.set(slug)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class TenantSession(Session):
+    """
+    Session that sends every query to the current hospital's database, or
+    to its read-only snapshot inside snapshot-routed views.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        from app import snapshot
+
+        if bind is None:
+            slug = current_tenant()
+            key = snapshot.read_bind(slug)
+            if key is not None:
+                return self._db.engines[key]
+            if slug is not None:
+                return self._db.engines[bind_key(slug)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# ======================================================
+# REGISTRY
+# ======================================================
+
+def load_registry(path):
+    """Return {slug: {"db": path, "node": name}} from the tenants file."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_registry(path, registry):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(registry, fh, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def configure_binds(app):
+    """Register one Flask-SQLAlchemy bind (and so one pool) per hospital."""
+    registry = load_registry(app.config["TENANTS_FILE"])
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    for slug, entry in registry.items():
+        binds[bind_key(slug)] = {
+            "url": "sqlite:///" + entry["db"],
+            "pool_size": app.config["TENANT_POOL_SIZE"],
+        }
+    app.config["SQLALCHEMY_BINDS"] = binds
+    app.extensions["tenants"] = registry
+
+
+def engines(app):
+    """{slug or None: engine} for every hospital served by this app."""
+    from app import db
+
+    with app.app_context():
+        found = {None: db.engine}
+        for slug in app.extensions["tenants"]:
+            found[slug] = db.engines[bind_key(slug)]
+    return found
+
+
+def prepare_database(engine):
+    """Create missing tables and indexes on one database."""
+    from app import db
+
+    # WAL is stored in the database file, so this sticks for every later
+    # connection; readers (and snapshot/move backups) no longer block writers
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+    db.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any indexes
+    # introduced since the database file was first created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+# ======================================================
+# REQUEST ROUTING
+# ======================================================
+
+def resolve():
+    """Pick the hospital for this request from the header or subdomain."""
+    slug = request.headers.get(current_app.config["TENANT_HEADER"])
+
+    base = current_app.config["TENANT_BASE_DOMAIN"]
+    if not slug and base:
+        host = request.host.split(":")[0].lower()
+        if host.endswith("." + base):
+            slug = host[: -len(base) - 1]
+
+    if not slug or slug == current_app.config["TENANT_DEFAULT_NAME"]:
+        slug = None
+    elif slug not in current_app.extensions["tenants"]:
+        abort(404)
+
+    _current.set(slug)
+
+
+def reset(exc=None):
+    _current.set(None)
+
+
+def session_matches():
+    """A login cookie is only valid for the hospital that issued it."""
+    return session.get("tenant") == current_tenant()
+
+
+def remember_login():
+    session["tenant"] = current_tenant()
+
+
+def fan_out(fn, max_workers=None):
+    """
+    Call fn() once per hospital, in parallel, each inside its own app
+    context routed to that hospital. Returns {name: result}.
+    """
+    app = current_app._get_current_object()
+    slugs = [None] + sorted(app.extensions["tenants"])
+    default_name = app.config["TENANT_DEFAULT_NAME"]
+
+    def run(slug):
+        with app.app_context(), use(slug):
+            return fn()
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(slugs)) as pool:
+        # each task runs in a copy of the caller's context (snapshot routing)
+        futures = [pool.submit(copy_context().run, run, slug) for slug in slugs]
+        results = [f.result() for f in futures]
+
+    return {slug or default_name: result for slug, result in zip(slugs, results)}
+
+
+# ======================================================
+# CLI
+# ======================================================
+
+tenant_cli = AppGroup("tenant", help="Provision and move hospital databases.")
+
+
+def _node_path(node_dir, slug):
+    return os.path.join(os.path.abspath(node_dir), f"{slug}.db")
+
+
+def _release(slug):
+    """Close this process's own connections to one hospital's database."""
+    from app import db
+
+    engine = db.engines.get(bind_key(slug))
+    if engine is not None:
+        engine.dispose()
+    snap = current_app.extensions.get("snapshots", {}).get(slug)
+    if snap is not None:
+        snap.close()
+
+
+@tenant_cli.command("list")
+def list_tenants():
+    """Show every hospital and where its database lives."""
+    registry = load_registry(current_app.config["TENANTS_FILE"])
+    click.echo(f"{current_app.config['TENANT_DEFAULT_NAME']}\t(default)\t"
+               f"{current_app.config['SQLALCHEMY_DATABASE_URI']}")
+    for slug, entry in sorted(registry.items()):
+        click.echo(f"{slug}\t{entry.get('node', '')}\t{entry['db']}")
+
+
+@tenant_cli.command("create")
+@click.argument("slug")
+@click.option("--node", "node_dir", default=None,
+              help="Directory (node mount) for the database file.")
+@click.option("--admin-email", default=None)
+@click.option("--admin-password", default=None)
+def create_tenant(slug, node_dir, admin_email, admin_password):
+    """Provision a new hospital database."""
+    from sqlalchemy import create_engine, insert
+    from app.models import User
+
+    if not SLUG.match(slug) or slug == current_app.config["TENANT_DEFAULT_NAME"]:
+        raise click.BadParameter("use lowercase letters, digits and dashes", param_hint="SLUG")
+
+    path = current_app.config["TENANTS_FILE"]
+    registry = load_registry(path)
+    if slug in registry:
+        raise click.ClickException(f"hospital '{slug}' already exists")
+
+    node_dir = node_dir or current_app.config["TENANT_DATA_DIR"]
+    os.makedirs(node_dir, exist_ok=True)
+    db_path = _node_path(node_dir, slug)
+
+    engine = create_engine("sqlite:///" + db_path)
+    try:
+        prepare_database(engine)
+        if admin_email:
+            # Core insert: the ORM hooks would audit this into the wrong database
+            with engine.begin() as conn:
+                conn.execute(insert(User.__table__).values(
+                    name="Hospital Admin",
+                    email=admin_email,
+                    role="admin",
+                    password_hash=generate_password_hash(admin_password or "admin123"),
+                ))
+    finally:
+        engine.dispose()
+
+    registry[slug] = {"db": db_path, "node": os.path.abspath(node_dir)}
+    save_registry(path, registry)
+    click.echo(f"Created hospital '{slug}' at {db_path}; restart the app to serve it")
+
+
+@tenant_cli.command("move")
+@click.argument("slug")
+@click.argument("node_dir")
+@click.option("--keep-source", is_flag=True, help="Leave the old database file in place.")
+def move_tenant(slug, node_dir, keep_source):
+    """
+    Copy a hospital's database to another node and repoint it there.
+
+    Stop the app first, not just traffic: its pooled connections, audit
+    writer and purge thread keep writing to the old file. The move refuses
+    to start while any other process still has the database open.
+    """
+    path = current_app.config["TENANTS_FILE"]
+    registry = load_registry(path)
+    if slug not in registry:
+        raise click.ClickException(f"unknown hospital '{slug}'")
+
+    source = registry[slug]["db"]
+    os.makedirs(node_dir, exist_ok=True)
+    target = _node_path(node_dir, slug)
+    if os.path.abspath(source) == target:
+        raise click.ClickException("hospital already lives on that node")
+
+    # the app hosting this command has the database open too
+    _release(slug)
+
+    src = sqlite3.connect(source, timeout=0, isolation_level=None)
+    try:
+        # in WAL mode an exclusive lock cannot be taken while another
+        # process has the database open, even if it is idle; once taken it
+        # is held until close, so nothing can write behind the copy
+        src.execute("PRAGMA locking_mode=EXCLUSIVE")
+        try:
+            src.execute("BEGIN EXCLUSIVE")
+            src.execute("COMMIT")
+        except sqlite3.OperationalError:
+            raise click.ClickException(
+                f"{source} is still open in another process; stop the app first"
+            )
+
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst)
+            # the copy inherits WAL mode from the source
+            if dst.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                raise click.ClickException(f"integrity check failed on {target}")
+        finally:
+            dst.close()
+
+        # fold the WAL into the main file so the old node keeps no -wal
+        src.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        src.close()
+
+    registry[slug] = {"db": target, "node": os.path.abspath(node_dir)}
+    save_registry(path, registry)
+
+    if not keep_source:
+        for leftover in (source, source + "-wal", source + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    click.echo(f"Moved '{slug}' to {target}; start the app again to serve it from there")
@@ -18,3 +18,43 @@ class Config:
 
     # Disable unnecessary SQLAlchemy event tracking
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Audit trail: committed changes are journaled here, then written to the
+    # audit_log table in batches by a background thread
+    AUDIT_JOURNAL_PATH = os.path.join(BASE_DIR, "audit.journal")
+    AUDIT_BATCH_SIZE = 200
+    AUDIT_FLUSH_INTERVAL = 2.0  # seconds
+
+    # Opt-in compression of HTML pages rendered by the main blueprint.
+    # Static assets are precompressed by `flask build-assets` instead.
+    COMPRESS_HTML = os.environ.get("COMPRESS_HTML") == "1"
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIN_SIZE = 500  # bytes
+
+    # Live doctor dashboard (server-sent events)
+    LIVE_KEEPALIVE = 15    # seconds between keepalive comments
+    LIVE_QUEUE_SIZE = 100  # undelivered events per stream before a resync
+
+    # Multi-hospital routing: each hospital listed in TENANTS_FILE gets its
+    # own SQLite database and pool. Requests pick one via TENANT_HEADER or a
+    # subdomain of TENANT_BASE_DOMAIN; otherwise the database above is used.
+    TENANTS_FILE = os.path.join(BASE_DIR, "tenants.json")
+    TENANT_DATA_DIR = os.path.join(BASE_DIR, "hospitals")
+    TENANT_HEADER = "X-Hospital"
+    TENANT_BASE_DOMAIN = os.environ.get("TENANT_BASE_DOMAIN")
+    TENANT_DEFAULT_NAME = "default"
+    TENANT_POOL_SIZE = 5
+
+    # Read-only snapshot for heavy admin reads: a copy of each database made
+    # with the SQLite backup API, refreshed once it is SNAPSHOT_MAX_LAG
+    # seconds old and the source has changed (checked every
+    # SNAPSHOT_CHECK_INTERVAL seconds)
+    SNAPSHOT_ENABLED = os.environ.get("SNAPSHOT_READS") == "1"
+    SNAPSHOT_DIR = os.path.join(BASE_DIR, "snapshots")
+    SNAPSHOT_MAX_LAG = 30
+    SNAPSHOT_CHECK_INTERVAL = 5
+
+    # Idempotency keys for booking / reschedule / completion forms
+    IDEMPOTENCY_TTL = 24 * 3600           # seconds a token is remembered
+    IDEMPOTENCY_PURGE_INTERVAL = 15 * 60  # seconds between purges
+    IDEMPOTENCY_WAIT = 5                  # seconds a duplicate waits for the first
@@ -0,0 +1,60 @@
+from datetime import date, time, timedelta
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from app.models import User, Department, DoctorProfile, Appointment
+from config import Config
+
+PASSWORD = "test-password"
+
+
+@pytest.fixture
+def app(tmp_path):
+    """An app on a scratch database; nothing is seeded."""
+    class ScratchConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "test.db")
+        AUDIT_JOURNAL_PATH = str(tmp_path / "audit.journal")
+        TENANTS_FILE = str(tmp_path / "tenants.json")
+        SNAPSHOT_ENABLED = False
+        SNAPSHOT_DIR = str(tmp_path / "snapshots")
+
+    app = create_app(ScratchConfig)
+    yield app
+    app.extensions["audit"].stop()
+
+
+@pytest.fixture
+def seeded(app):
+    """
+    One patient booked with one doctor. Returns the ids tests need:
+    {"patient": id, "doctor": id, "appointment": id}.
+    """
+    with app.app_context():
+        patient = User(name="Patient", email="patient@test.local", role="patient",
+                       password_hash=generate_password_hash(PASSWORD))
+        doctor = User(name="Doctor", email="doctor@test.local", role="doctor",
+                      password_hash=generate_password_hash(PASSWORD))
+        department = Department(name="Cardiology", description="Heart")
+        db.session.add_all([patient, doctor, department])
+        db.session.commit()
+
+        db.session.add(DoctorProfile(user_id=doctor.id, department_id=department.id,
+                                     availability="Mon-Fri"))
+        appt = Appointment(patient_id=patient.id, doctor_id=doctor.id,
+                           date=date.today() + timedelta(days=2), time=time(9))
+        db.session.add(appt)
+        db.session.commit()
+
+        return {"patient": patient.id, "doctor": doctor.id, "appointment": appt.id}
+
+
+@pytest.fixture
+def login():
+    """login(client, role) signs a test client in as the seeded user."""
+    def login(client, role):
+        resp = client.post("/login", data={"email": f"{role}@test.local", "password": PASSWORD})
+        assert resp.status_code == 302
+    return login
@@ -0,0 +1,89 @@
+import threading
+from datetime import date, time
+
+from app.models import Appointment, Treatment
+
+CALLERS = 8
+TOKEN = "d0" * 16
+
+
+def post_concurrently(app, login, role, url, form):
+    """POST the same form from CALLERS logged-in clients at once."""
+    barrier = threading.Barrier(CALLERS)
+    results = [None] * CALLERS
+    errors = []
+
+    def call(i):
+        try:
+            client = app.test_client()
+            login(client, role)
+
+            barrier.wait()
+            resp = client.post(url, data=form)
+            with client.session_transaction() as sess:
+                flashes = sess.get("_flashes", [])
+            results[i] = (resp.status_code, resp.location, flashes)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(CALLERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    return results
+
+
+def test_concurrent_booking_creates_one_appointment(app, seeded, login):
+    doctor_id = seeded["doctor"]
+    results = post_concurrently(app, login, "patient", f"/book-appointment/{doctor_id}", {
+        "date": "2031-01-06", "time": "09:00", "idempotency_key": TOKEN,
+    })
+
+    assert len(set(map(repr, results))) == 1
+    status, location, flashes = results[0]
+    assert status == 302
+    assert location == "/patient/dashboard"
+    assert flashes == [("success", "Appointment booked successfully")]
+
+    with app.app_context():
+        booked = Appointment.query.filter_by(
+            doctor_id=doctor_id, date=date(2031, 1, 6), time=time(9)
+        ).count()
+    assert booked == 1
+
+
+def test_concurrent_completion_creates_one_treatment(app, seeded, login):
+    appt_id = seeded["appointment"]
+    results = post_concurrently(app, login, "doctor", f"/doctor/complete-appointment/{appt_id}", {
+        "diagnosis": "Flu", "prescription": "Rest", "notes": "", "idempotency_key": TOKEN,
+    })
+
+    assert len(set(map(repr, results))) == 1
+    status, location, flashes = results[0]
+    assert status == 302
+    assert location == "/doctor/appointments"
+    assert flashes == [("success", "Appointment marked as completed")]
+
+    with app.app_context():
+        assert Treatment.query.filter_by(appointment_id=appt_id).count() == 1
+
+
+def test_released_token_is_retried_once(app, seeded, login, monkeypatch):
+    from app import idempotency
+
+    claims = []
+    # every claim loses to an attempt that then fails and releases the token
+    monkeypatch.setattr(idempotency, "_claim", lambda engine, token: claims.append(token))
+    monkeypatch.setattr(idempotency, "_wait_for_result", lambda engine, token: None)
+
+    client = app.test_client()
+    login(client, "patient")
+    resp = client.post(f"/book-appointment/{seeded['doctor']}", data={
+        "date": "2031-01-06", "time": "09:00", "idempotency_key": TOKEN,
+    })
+
+    assert resp.status_code == 409
+    assert claims == [TOKEN, TOKEN]
@@ -0,0 +1,17 @@
+from app import db
+from app.query_plans import check_app_plans
+
+
+def test_route_query_plans(app):
+    assert check_app_plans(app) == []
+
+
+def test_missing_index_is_reported(app):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_appointment_patient_date")
+
+    failures = check_app_plans(app)
+
+    assert failures
+    assert all("scan" in problem or "b-tree" in problem for _, problem, _ in failures)